@@ -1,22 +1,352 @@
-from datetime import datetime
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import List
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
-from sqlalchemy import select
+import aiofiles
+import orjson
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, File, Query, Request, UploadFile, HTTPException
+from fastapi.responses import FileResponse, ORJSONResponse, Response
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from sqlalchemy import bindparam, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.settings import STORAGE_DIR
 from app.db.database import get_db
 from app.db.models import Document
-from app.api.v1.documents.schemas import DocumentOut, UploadResult
+from app.api.v1.documents.schemas import DocumentOut, DocumentPage, UploadResult
 
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
-STORAGE_DIR = Path("storage")
 MAX_FILE_SIZE_MB = 20
+MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+PDF_MAGIC = b"%PDF"
 ALLOWED_CONTENT_TYPES = {"application/pdf"}
+MAX_CONCURRENT_SAVES = 8
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9._-]")
+MAX_SAFE_NAME_LENGTH = 100
+# Matches Document.original_filename's String(255)
+MAX_FILENAME_LENGTH = 255
+MAX_PAGE_SIZE = 500
+MAX_DOCUMENT_ID = 2**31 - 1
+
+# Uploads with at least this many new documents are inserted via COPY
+COPY_THRESHOLD = 200
+_CREATE_STAGING_SQL = """
+CREATE TEMP TABLE documents_staging (
+    original_filename varchar(255),
+    stored_path varchar(512),
+    sha256 varchar(64),
+    uploaded_at timestamptz
+) ON COMMIT DROP
+"""
+_INSERT_FROM_STAGING_SQL = """
+INSERT INTO documents (original_filename, stored_path, sha256, uploaded_at)
+SELECT original_filename, stored_path, sha256, uploaded_at FROM documents_staging
+ON CONFLICT (sha256) DO NOTHING
+RETURNING sha256, id
+"""
+
+# When set (e.g. "/_protected_storage/"), downloads are served by nginx via
+# X-Accel-Redirect instead of streaming through the worker. Expects:
+#   location /_protected_storage/ { internal; alias /app/storage/; sendfile on; }
+ACCEL_REDIRECT_PREFIX = os.getenv("DOWNLOAD_ACCEL_REDIRECT_PREFIX")
+
+# Signed, short-lived download links returned by get_document. The secret must
+# be shared by every worker so any of them can verify a link.
+DOWNLOAD_TOKEN_SECRET = os.getenv("DOWNLOAD_TOKEN_SECRET")
+
+if not DOWNLOAD_TOKEN_SECRET:
+    raise RuntimeError("DOWNLOAD_TOKEN_SECRET is not set")
+
+DOWNLOAD_TOKEN_MAX_AGE_SECONDS = 300
+_download_signer = URLSafeTimedSerializer(
+    DOWNLOAD_TOKEN_SECRET,
+    salt="document-download",
+)
+
+# Built once at import so every lookup reuses the same cached compiled form
+_GET_DOC_BY_ID = select(Document).where(Document.id == bindparam("id"))
+_LIST_DOCS = select(
+    Document.id,
+    Document.original_filename,
+    Document.stored_path,
+    Document.uploaded_at,
+)
+
+# Read-aside caches of serialized metadata. Document rows are immutable after
+# upload, so per-id entries only expire by TTL; the list cache is short-lived
+# and cleared on every upload. Only touched from the event loop, no locking.
+DOC_CACHE_TTL_SECONDS = 300
+LIST_CACHE_TTL_SECONDS = 5
+_doc_cache: TTLCache = TTLCache(maxsize=10_000, ttl=DOC_CACHE_TTL_SECONDS)
+_list_cache: TTLCache = TTLCache(maxsize=128, ttl=LIST_CACHE_TTL_SECONDS)
+
+# Caps concurrent disk writes across all in-flight uploads
+_SAVE_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_SAVES)
+
+# Dedicated, bounded pool for blocking storage I/O so disk saturation can't
+# starve the default executor (used by Starlette for UploadFile reads)
+_IO_POOL = ThreadPoolExecutor(
+    max_workers=min(32, (os.cpu_count() or 1) * 4),
+    thread_name_prefix="storage-io",
+)
+
+
+async def _run_io(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_IO_POOL, func, *args)
+
+
+def _safe_name(filename: str | None) -> str:
+    # Drop any directory part and anything outside a conservative ASCII set,
+    # and cap the length (keeping the extension) so staged names stay well
+    # under the filesystem's 255-byte limit
+    name = (filename or "").replace("\\", "/").rsplit("/", 1)[-1]
+    name = _UNSAFE_FILENAME_CHARS.sub("_", name).lstrip(".")
+    if len(name) > MAX_SAFE_NAME_LENGTH:
+        suffix = Path(name).suffix[:16]
+        name = name[: MAX_SAFE_NAME_LENGTH - len(suffix)] + suffix
+    return name or "upload.pdf"
+
+
+def _content_path(digest: str) -> Path:
+    return STORAGE_DIR / digest[:2] / digest
+
+
+def _not_a_pdf(file: UploadFile) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"File {file.filename} is not a valid PDF.",
+    )
+
+
+async def _save_upload(file: UploadFile, file_path: Path) -> tuple[str, Path, str]:
+    # Stream to disk in chunks, enforcing the size limit and hashing as we go
+    async with _SAVE_SEMAPHORE:
+        size = 0
+        head = b""
+        digest = hashlib.sha256()
+        try:
+            async with aiofiles.open(file_path, "wb", executor=_IO_POOL) as out:
+                while chunk := await file.read(CHUNK_SIZE):
+                    if len(head) < len(PDF_MAGIC):
+                        head += chunk[: len(PDF_MAGIC) - len(head)]
+                        if len(head) == len(PDF_MAGIC) and head != PDF_MAGIC:
+                            raise _not_a_pdf(file)
+                    size += len(chunk)
+                    if size > MAX_FILE_SIZE_BYTES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File {file.filename} is too large. "
+                                   f"Max allowed is {MAX_FILE_SIZE_MB} MB.",
+                        )
+                    digest.update(chunk)
+                    await out.write(chunk)
+
+            # Empty or shorter than the magic bytes: never sniffed above
+            if head != PDF_MAGIC:
+                raise _not_a_pdf(file)
+        except BaseException:
+            # Includes CancelledError when the client disconnects mid-upload
+            file_path.unlink(missing_ok=True)
+            raise
+
+    return file.filename, file_path, digest.hexdigest()
+
+
+def _discard_files(paths: list[Path]) -> None:
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+def _commit_files(moves: list[tuple[Path, Path]]) -> None:
+    # Flush every staged file, atomically rename them into place (same
+    # filesystem), then sync each touched directory once for the whole batch
+    for tmp_path, _ in moves:
+        fd = os.open(tmp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            # Write-once PDFs: drop the now-clean pages from the page cache
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+    parents = set()
+    for tmp_path, content_path in moves:
+        try:
+            content_path.parent.mkdir()
+            # A new shard's entry lives in STORAGE_DIR, which must be synced too
+            parents.add(STORAGE_DIR)
+        except FileExistsError:
+            pass
+        os.replace(tmp_path, content_path)
+        parents.add(content_path.parent)
+
+    for parent in parents:
+        fd = os.open(parent, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+async def _copy_insert(db: AsyncSession, rows: list[dict]) -> list[tuple[str, int]]:
+    # COPY can neither return ids nor skip conflicts, so stream the rows into a
+    # transaction-scoped staging table and move them over with one INSERT
+    await db.execute(text(_CREATE_STAGING_SQL))
+    conn = await db.connection()
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "documents_staging",
+        records=[
+            (
+                row["original_filename"],
+                row["stored_path"],
+                row["sha256"],
+                row["uploaded_at"],
+            )
+            for row in rows
+        ],
+        columns=["original_filename", "stored_path", "sha256", "uploaded_at"],
+    )
+    result = await db.execute(text(_INSERT_FROM_STAGING_SQL))
+    return result.all()
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # Weak comparison per RFC 9110 section 13.1.2: "*", or any listed tag
+    # whose opaque part equals ours regardless of W/ prefixes
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def _encode_cursor(uploaded_at: datetime, document_id: int) -> str:
+    raw = f"{uploaded_at.isoformat()}|{document_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    invalid = HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        uploaded_at, document_id = raw.split("|")
+        before_at, before_id = datetime.fromisoformat(uploaded_at), int(document_id)
+    except ValueError:
+        raise invalid
+    # Naive times would be read as server-local; ids must fit the int4 column
+    if before_at.tzinfo is None or not 1 <= before_id <= MAX_DOCUMENT_ID:
+        raise invalid
+    return before_at, before_id
+
+
+async def _list_page(
+    db: AsyncSession, limit: int, cursor: str | None
+) -> tuple[bytes, str]:
+    # Keyset pagination on (uploaded_at, id), newest first
+    stmt = _LIST_DOCS
+    if cursor is not None:
+        before_at, before_id = _decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(Document.uploaded_at, Document.id) < tuple_(before_at, before_id)
+        )
+    stmt = stmt.order_by(Document.uploaded_at.desc(), Document.id.desc()).limit(limit)
+
+    # Plain column rows: skips ORM instance hydration and per-row validation
+    rows = (await db.execute(stmt)).all()
+    items = [
+        {
+            "id": row[0],
+            "original_filename": row[1],
+            "stored_path": row[2],
+            "uploaded_at": row[3],
+        }
+        for row in rows
+    ]
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = _encode_cursor(rows[-1][3], rows[-1][0])
+
+    # orjson serializes the datetimes natively
+    body = orjson.dumps({"items": items, "next_cursor": next_cursor})
+    # Weak: GZipMiddleware may send a different byte representation
+    etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    return body, etag
+
+
+async def _get_document_data(db: AsyncSession, document_id: int) -> dict:
+    cached = _doc_cache.get(document_id)
+    if cached is not None:
+        return cached
+
+    result = await db.execute(_GET_DOC_BY_ID, {"id": document_id})
+    doc = result.scalar_one_or_none()
+
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    # Trusted DB data: build the dict directly, no model round-trip
+    item = {
+        "id": doc.id,
+        "original_filename": doc.original_filename,
+        "stored_path": doc.stored_path,
+        "uploaded_at": doc.uploaded_at,
+    }
+    _doc_cache[document_id] = item
+    return item
+
+
+async def _file_response(stored_path: str, filename: str) -> Response:
+    file_path = Path(stored_path)
+
+    if ACCEL_REDIRECT_PREFIX:
+        # Hand the transfer to the reverse proxy; it 404s on missing files itself
+        return Response(
+            status_code=200,
+            media_type="application/octet-stream",
+            headers={
+                "X-Accel-Redirect": (
+                    f"{ACCEL_REDIRECT_PREFIX}"
+                    f"{quote(file_path.relative_to(STORAGE_DIR).as_posix())}"
+                ),
+                "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+            },
+        )
+
+    # Single stat, off the event loop, reused by FileResponse for its headers
+    try:
+        st = await _run_io(os.stat, file_path)
+    except FileNotFoundError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail="Stored file not found on disk")
+
+    return FileResponse(
+        path=file_path,
+        filename=filename,
+        media_type="application/octet-stream",
+        stat_result=st,
+    )
 
 
 @router.post("/upload", response_model=UploadResult)
@@ -27,72 +357,182 @@ async def upload_documents(
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded")
 
-    STORAGE_DIR.mkdir(parents=True, exist_ok=True)
-
-    saved_ids: list[int] = []
-
+    # Validate content types, filenames and known sizes up front, before
+    # touching the disk
     for file in files:
-        # Validate content type
         if file.content_type not in ALLOWED_CONTENT_TYPES:
             raise HTTPException(
                 status_code=400,
                 detail=f"Unsupported file type: {file.content_type}. Only PDF is allowed.",
             )
-
-        # Read content once to enforce size limit
-        contents = await file.read()
-        size_mb = len(contents) / (1024 * 1024)
-
-        if size_mb > MAX_FILE_SIZE_MB:
+        if file.filename and len(file.filename) > MAX_FILENAME_LENGTH:
             raise HTTPException(
                 status_code=400,
-                detail=f"File {file.filename} is too large ({size_mb:.2f} MB). "
+                detail=f"Filename is too long. Max allowed is {MAX_FILENAME_LENGTH} characters.",
+            )
+        if file.size is not None and file.size > MAX_FILE_SIZE_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File {file.filename} is too large. "
                        f"Max allowed is {MAX_FILE_SIZE_MB} MB.",
             )
 
-        # Save to disk
-        file_path = STORAGE_DIR / f"{datetime.utcnow().timestamp()}_{file.filename}"
-        with file_path.open("wb") as buffer:
-            buffer.write(contents)
+    # Save all files concurrently to temporary names; DB work happens once
+    # everything is on disk. One timestamp per request; the index keeps names
+    # unique within it and the random token guards against collisions across
+    # workers
+    prefix = f"{time.time_ns()}_{os.urandom(4).hex()}"
+    staged = [
+        STORAGE_DIR / f"{prefix}_{i}_{_safe_name(file.filename)}"
+        for i, file in enumerate(files)
+    ]
+    try:
+        # The first failure cancels the sibling saves instead of letting them
+        # stream to completion; surface that failure itself, not the group
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tasks = [
+                    tg.create_task(_save_upload(file, path))
+                    for file, path in zip(files, staged)
+                ]
+        except BaseExceptionGroup as group:
+            raise group.exceptions[0]
 
-        # Store metadata in DB
-        doc = Document(
-            original_filename=file.filename,
-            stored_path=str(file_path),
+        saved: list[tuple[str, Path, str]] = [task.result() for task in tasks]
+
+        # Reuse rows for content we already have
+        result = await db.execute(
+            select(Document.sha256, Document.id).where(
+                Document.sha256.in_({digest for _, _, digest in saved})
+            )
         )
-        db.add(doc)
-        await db.flush()
-        saved_ids.append(doc.id)
+        ids_by_digest = dict(result.all())
+
+        # Set explicitly (timezone-aware) so the INSERT and COPY paths agree
+        uploaded_at = datetime.now(timezone.utc)
+
+        # Only the first staged copy of each new digest goes into
+        # content-addressed storage; duplicates (of existing rows or within the
+        # batch) are dropped
+        new_rows: dict[str, dict] = {}
+        moves: list[tuple[Path, Path]] = []
+        duplicates: list[Path] = []
+        for filename, tmp_path, digest in saved:
+            if digest in ids_by_digest or digest in new_rows:
+                duplicates.append(tmp_path)
+                continue
+            content_path = _content_path(digest)
+            moves.append((tmp_path, content_path))
+            new_rows[digest] = {
+                "original_filename": filename,
+                "stored_path": str(content_path),
+                "sha256": digest,
+                "uploaded_at": uploaded_at,
+            }
+
+        if duplicates:
+            await _run_io(_discard_files, duplicates)
+        if moves:
+            await _run_io(_commit_files, moves)
+    except BaseException:
+        # Errors, or cancellation on client disconnect: drop every staged file
+        # that wasn't moved into place. Synchronous, so it can't be interrupted
+        for path in staged:
+            path.unlink(missing_ok=True)
+        raise
+
+    # Insert the new content in one statement
+    rows = list(new_rows.values())
+    if len(rows) >= COPY_THRESHOLD:
+        ids_by_digest.update(await _copy_insert(db, rows))
+    elif rows:
+        result = await db.execute(
+            pg_insert(Document)
+            .on_conflict_do_nothing(index_elements=[Document.sha256])
+            .returning(Document.sha256, Document.id),
+            rows,
+        )
+        ids_by_digest.update(result.all())
+
+    # Rows inserted concurrently by another request were skipped above
+    missing = [row["sha256"] for row in rows if row["sha256"] not in ids_by_digest]
+    if missing:
+        result = await db.execute(
+            select(Document.sha256, Document.id).where(Document.sha256.in_(missing))
+        )
+        ids_by_digest.update(result.all())
+
+    saved_ids = [ids_by_digest[digest] for _, _, digest in saved]
 
     await db.commit()
+    _list_cache.clear()
 
     return UploadResult(uploaded_ids=saved_ids, count=len(saved_ids))
 
 
-
-@router.get("/", response_model=list[DocumentOut])
+@router.get("/", response_model=None, responses={200: {"model": DocumentPage}})
 async def list_documents(
+    request: Request,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
     db: AsyncSession = Depends(get_db),
-) -> list[DocumentOut]:
-    result = await db.execute(select(Document))
-    docs = result.scalars().all()
-    return [DocumentOut.model_validate(d) for d in docs]
+) -> Response:
+    cache_key = (limit, cursor)
+    cached = _list_cache.get(cache_key)
+    if cached is None:
+        cached = await _list_page(db, limit, cursor)
+        _list_cache[cache_key] = cached
 
+    body, etag = cached
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
 
-@router.get("/{document_id}", response_model=DocumentOut)
+    # Pre-serialized bytes, so FastAPI skips jsonable_encoder entirely
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+@router.get("/download/{token}", name="download_document_by_token")
+async def download_document_by_token(token: str):
+    # Everything needed to serve the file is in the signed token: no DB hit
+    try:
+        data = _download_signer.loads(token, max_age=DOWNLOAD_TOKEN_MAX_AGE_SECONDS)
+    except SignatureExpired:
+        raise HTTPException(status_code=410, detail="Download link expired")
+    except BadSignature:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    return await _file_response(data["path"], data["filename"])
+
+
+@router.get(
+    "/{document_id}",
+    response_model=None,
+    responses={200: {"model": DocumentOut}},
+)
 async def get_document(
     document_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
-) -> DocumentOut:
-    result = await db.execute(
-        select(Document).where(Document.id == document_id)
-    )
-    doc = result.scalar_one_or_none()
-
-    if doc is None:
-        raise HTTPException(status_code=404, detail="Document not found")
+) -> ORJSONResponse:
+    item = await _get_document_data(db, document_id)
 
-    return DocumentOut.model_validate(doc)
+    # Signed per response so the link's lifetime is independent of the cache
+    token = _download_signer.dumps(
+        {
+            "id": item["id"],
+            "path": item["stored_path"],
+            "filename": item["original_filename"],
+        }
+    )
+    # Returned directly so FastAPI skips output validation and jsonable_encoder
+    return ORJSONResponse(
+        {
+            **item,
+            "download_url": str(
+                request.url_for("download_document_by_token", token=token)
+            ),
+        }
+    )
 
 
 @router.get("/{document_id}/download")
@@ -100,21 +540,5 @@ async def download_document(
     document_id: int,
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(
-        select(Document).where(Document.id == document_id)
-    )
-    doc = result.scalar_one_or_none()
-
-    if doc is None:
-        raise HTTPException(status_code=404, detail="Document not found")
-
-    file_path = Path(doc.stored_path)
-
-    if not file_path.is_file():
-        raise HTTPException(status_code=404, detail="Stored file not found on disk")
-
-    return FileResponse(
-        path=file_path,
-        filename=doc.original_filename,
-        media_type="application/octet-stream",
-    )
+    item = await _get_document_data(db, document_id)
+    return await _file_response(item["stored_path"], item["original_filename"])
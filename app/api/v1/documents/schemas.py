@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class DocumentOut(BaseModel):
@@ -8,9 +8,14 @@ class DocumentOut(BaseModel):
     original_filename: str
     stored_path: str
     uploaded_at: datetime
+    download_url: str | None = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class DocumentPage(BaseModel):
+    items: list[DocumentOut]
+    next_cursor: str | None = None
 
 
 class UploadResult(BaseModel):
@@ -0,0 +1,91 @@
+import re
+
+from starlette.exceptions import HTTPException
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+# An HTTPException so FastAPI's body parsing re-raises it as-is (rendered as
+# a 413) instead of wrapping it in a generic 400
+class _BodyTooLarge(HTTPException):
+    def __init__(self) -> None:
+        super().__init__(status_code=413, detail="Request body too large")
+
+
+# Rejects request bodies over max_body_size bytes with a 413. Runs before
+# FastAPI parses multipart forms, so oversized uploads are refused from the
+# Content-Length header or cut off mid-stream instead of being spooled first.
+class BodySizeLimitMiddleware:
+    def __init__(self, app: ASGIApp, max_body_size: int) -> None:
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    await self._reject(
+                        scope, receive, send, 400, "Invalid Content-Length header"
+                    )
+                    return
+                if content_length > self.max_body_size:
+                    await self._reject(scope, receive, send)
+                    return
+                break
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise _BodyTooLarge
+            return message
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if response_started:
+                raise
+            await self._reject(scope, receive, send)
+
+    @staticmethod
+    async def _reject(
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        status_code: int = 413,
+        detail: str = "Request body too large",
+    ) -> None:
+        response = PlainTextResponse(detail, status_code=status_code)
+        await response(scope, receive, send)
+
+
+# GZipMiddleware that passes responses for paths matching exclude_path through
+# untouched, e.g. file downloads whose content is already compressed
+class SelectiveGZipMiddleware(GZipMiddleware):
+    def __init__(self, app: ASGIApp, exclude_path: str, **kwargs) -> None:
+        super().__init__(app, **kwargs)
+        self.exclude_path = re.compile(exclude_path)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and self.exclude_path.search(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
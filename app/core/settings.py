@@ -0,0 +1,9 @@
+import os
+from pathlib import Path
+
+STORAGE_DIR = Path("storage")
+
+# Whole request body limit, enforced by BodySizeLimitMiddleware before the
+# multipart form is parsed
+MAX_REQUEST_SIZE_MB = int(os.getenv("MAX_REQUEST_SIZE_MB", 200))
+MAX_REQUEST_SIZE_BYTES = MAX_REQUEST_SIZE_MB * 1024 * 1024
@@ -0,0 +1,70 @@
+import asyncio
+import hashlib
+from pathlib import Path
+
+from sqlalchemy import select, update
+
+from app.db.database import AsyncSessionLocal
+from app.db.models import Document
+
+BATCH_SIZE = 500
+
+
+def _hash_file(path: Path) -> str | None:
+    try:
+        with path.open("rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+# Fills Document.sha256 for rows stored before deduplication existed. Rows
+# whose file is missing, or whose content duplicates an already hashed row,
+# are left NULL and reported.
+async def backfill() -> None:
+    last_id = 0
+    hashed = 0
+    skipped = 0
+
+    async with AsyncSessionLocal() as db:
+        while True:
+            result = await db.execute(
+                select(Document.id, Document.stored_path)
+                .where(Document.sha256.is_(None), Document.id > last_id)
+                .order_by(Document.id)
+                .limit(BATCH_SIZE)
+            )
+            rows = result.all()
+            if not rows:
+                break
+
+            last_id = rows[-1][0]
+            for document_id, stored_path in rows:
+                digest = await asyncio.to_thread(_hash_file, Path(stored_path))
+                if digest is None:
+                    print(f"document {document_id}: file missing at {stored_path}")
+                    skipped += 1
+                    continue
+
+                existing = await db.scalar(
+                    select(Document.id).where(Document.sha256 == digest)
+                )
+                if existing is not None:
+                    print(f"document {document_id}: duplicate of document {existing}")
+                    skipped += 1
+                    continue
+
+                await db.execute(
+                    update(Document)
+                    .where(Document.id == document_id)
+                    .values(sha256=digest)
+                )
+                hashed += 1
+
+            await db.commit()
+
+    print(f"hashed {hashed} documents, {skipped} left without sha256")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
@@ -2,6 +2,7 @@ from typing import AsyncGenerator
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import NullPool
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -18,10 +19,42 @@ class Base(DeclarativeBase):
 # Use asyncpg driver for async Postgres
 ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
-engine = create_async_engine(
-    ASYNC_DATABASE_URL,
-    echo=False,
-)
+# Connection pool tuning (override via env without a code change)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", (os.cpu_count() or 2) * 2 + 1))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", 1200))
+# Per-connection asyncpg prepared statement caches (hot by-id lookups reuse
+# their server-side plan)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500))
+
+# Behind PgBouncer in transaction mode: let PgBouncer do the pooling and
+# disable asyncpg's prepared statement caches (they are per-connection).
+DB_USE_PGBOUNCER = os.getenv("DB_USE_PGBOUNCER") == "1"
+
+if DB_USE_PGBOUNCER:
+    engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=False,
+        query_cache_size=DB_QUERY_CACHE_SIZE,
+        poolclass=NullPool,
+        connect_args={"statement_cache_size": 0, "prepared_statement_cache_size": 0},
+    )
+else:
+    engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=False,
+        query_cache_size=DB_QUERY_CACHE_SIZE,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_recycle=DB_POOL_RECYCLE,
+        connect_args={
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        },
+    )
 
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timezone
 
-from sqlalchemy import String, DateTime
+from sqlalchemy import Index, String, DateTime
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.database import Base
@@ -12,8 +12,18 @@ class Document(Base):
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     original_filename: Mapped[str] = mapped_column(String(255), nullable=False)
     stored_path: Mapped[str] = mapped_column(String(512), nullable=False)
+    # Nullable until migrations/0004 runs; see app/db/backfill_sha256.py
+    sha256: Mapped[str | None] = mapped_column(String(64), unique=True, index=True)
     uploaded_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
-        default=datetime.utcnow,
+        default=lambda: datetime.now(timezone.utc),
         nullable=False,
     )
+
+
+# Backs keyset pagination of the list endpoint (newest first)
+Index(
+    "ix_documents_uploaded_at_id",
+    Document.uploaded_at.desc(),
+    Document.id.desc(),
+)
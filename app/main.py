@@ -2,23 +2,61 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+import os
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import text
 
+from app.api.v1.documents.routes import router as documents_router
 from app.api.v1.health import router as health_router
+from app.core.middleware import BodySizeLimitMiddleware, SelectiveGZipMiddleware
+from app.core.settings import MAX_REQUEST_SIZE_BYTES, STORAGE_DIR
 from app.db.database import Base, engine
 
 
 app = FastAPI(
     title="Document Processing Pipeline",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
+)
+
+# Downloads are PDFs, which are already compressed
+app.add_middleware(
+    SelectiveGZipMiddleware,
+    minimum_size=1024,
+    exclude_path=r"/documents/(download/[^/]+|[^/]+/download)$",
 )
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=MAX_REQUEST_SIZE_BYTES)
 
 
 @app.on_event("startup")
 async def on_startup() -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+
+    # Schema is managed by the SQL files in migrations/; opt in to create_all
+    # for local/dev setups
+    if os.getenv("AUTO_CREATE_SCHEMA") == "1":
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    else:
+        # Fail at startup rather than on every request if migrations are behind
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text(
+                    "SELECT column_name FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() AND table_name = 'documents'"
+                )
+            )
+            columns = set(result.scalars())
+        missing = {c.name for c in Base.metadata.tables["documents"].columns} - columns
+        if missing:
+            raise RuntimeError(
+                f"documents schema is out of date (missing: {', '.join(sorted(missing))}): "
+                "apply migrations/*.sql or set AUTO_CREATE_SCHEMA=1"
+            )
 
 
 app.include_router(health_router, prefix="/api/v1")
+app.include_router(documents_router, prefix="/api/v1")
 
@@ -0,0 +1,15 @@
+-- Baseline schema, matching what Base.metadata.create_all produced before
+-- migrations were introduced. Safe to run against an existing database.
+--
+-- Apply migrations in order, outside an explicit transaction (some use
+-- CREATE INDEX CONCURRENTLY):
+--   psql "$DATABASE_URL" -f migrations/0001_create_documents.sql
+
+CREATE TABLE IF NOT EXISTS documents (
+    id SERIAL PRIMARY KEY,
+    original_filename VARCHAR(255) NOT NULL,
+    stored_path VARCHAR(512) NOT NULL,
+    uploaded_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_documents_id ON documents (id);
@@ -0,0 +1,5 @@
+-- Backs keyset pagination of the list endpoint (newest first).
+-- CONCURRENTLY avoids blocking uploads; it cannot run inside a transaction.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_documents_uploaded_at_id
+    ON documents (uploaded_at DESC, id DESC);
@@ -0,0 +1,10 @@
+-- Content hash used to deduplicate uploads. Added nullable so existing rows
+-- stay valid; fill it in afterwards with:
+--   python -m app.db.backfill_sha256
+-- NULLs never conflict, so the unique index is a valid ON CONFLICT (sha256)
+-- target before and after the backfill.
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_documents_sha256
+    ON documents (sha256);
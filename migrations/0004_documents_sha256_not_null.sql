@@ -0,0 +1,4 @@
+-- Apply only after `python -m app.db.backfill_sha256` reports no rows left
+-- without a hash (missing files or legacy duplicates must be resolved first).
+
+ALTER TABLE documents ALTER COLUMN sha256 SET NOT NULL;
@@ -0,0 +1,93 @@
+import base64
+import os
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+# Required at import time; nothing here connects or signs anything real
+os.environ.setdefault("DATABASE_URL", "postgresql://test@localhost/test")
+os.environ.setdefault("DOWNLOAD_TOKEN_SECRET", "test-secret")
+
+from app.api.v1.documents.routes import (  # noqa: E402
+    MAX_SAFE_NAME_LENGTH,
+    _decode_cursor,
+    _encode_cursor,
+    _etag_matches,
+    _safe_name,
+)
+
+
+@pytest.mark.parametrize(
+    "filename, expected",
+    [
+        ("report.pdf", "report.pdf"),
+        ("../../etc/passwd", "passwd"),
+        ("..", "upload.pdf"),
+        (None, "upload.pdf"),
+        ("", "upload.pdf"),
+        ("C:\\Users\\me\\..\\report.pdf", "report.pdf"),
+        ("..\\..\\secret.pdf", "secret.pdf"),
+        (".hidden.pdf", "hidden.pdf"),
+        ("résumé final.pdf", "r_sum__final.pdf"),
+    ],
+)
+def test_safe_name(filename, expected):
+    assert _safe_name(filename) == expected
+
+
+def test_safe_name_truncates_and_keeps_extension():
+    name = _safe_name("a" * 300 + ".pdf")
+    assert len(name) == MAX_SAFE_NAME_LENGTH
+    assert name.endswith(".pdf")
+
+
+ETAG = 'W/"abc"'
+
+
+@pytest.mark.parametrize(
+    "if_none_match, expected",
+    [
+        (None, False),
+        ("", False),
+        ("*", True),
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"x", W/"abc"', True),
+        ('"x","abc"', True),
+        ('"x", "y"', False),
+        ('"abcd"', False),
+    ],
+)
+def test_etag_matches(if_none_match, expected):
+    assert _etag_matches(if_none_match, ETAG) is expected
+
+
+def _raw_cursor(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def test_cursor_round_trip():
+    uploaded_at = datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)
+    assert _decode_cursor(_encode_cursor(uploaded_at, 42)) == (uploaded_at, 42)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        _raw_cursor("garbage"),
+        _raw_cursor("2024-01-01T00:00:00+00:00"),
+        _raw_cursor("2024-01-01T00:00:00+00:00|abc"),
+        _raw_cursor("not-a-date|1"),
+        _raw_cursor("2024-01-01T00:00:00|1"),
+        _raw_cursor("2024-01-01T00:00:00+00:00|0"),
+        _raw_cursor("2024-01-01T00:00:00+00:00|-1"),
+        _raw_cursor("2024-01-01T00:00:00+00:00|2147483648"),
+        _raw_cursor("2024-01-01T00:00:00+00:00|99999999999"),
+    ],
+)
+def test_invalid_cursor_rejected(cursor):
+    with pytest.raises(HTTPException) as exc_info:
+        _decode_cursor(cursor)
+    assert exc_info.value.status_code == 400
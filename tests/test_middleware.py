@@ -0,0 +1,76 @@
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.middleware import BodySizeLimitMiddleware, SelectiveGZipMiddleware
+
+MAX_BODY_SIZE = 16
+
+
+async def echo_size(request: Request) -> PlainTextResponse:
+    body = await request.body()
+    return PlainTextResponse(str(len(body)))
+
+
+app = Starlette(routes=[Route("/", echo_size, methods=["POST"])])
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=MAX_BODY_SIZE)
+client = TestClient(app)
+
+
+def test_body_within_limit_passes():
+    response = client.post("/", content=b"x" * MAX_BODY_SIZE)
+    assert response.status_code == 200
+    assert response.text == str(MAX_BODY_SIZE)
+
+
+def test_content_length_over_limit_rejected():
+    response = client.post("/", content=b"x" * (MAX_BODY_SIZE + 1))
+    assert response.status_code == 413
+
+
+def test_streamed_body_over_limit_cut_off():
+    def chunks():
+        for _ in range(4):
+            yield b"x" * 8
+
+    # A generator body is sent chunked, without a Content-Length header
+    response = client.post("/", content=chunks())
+    assert response.status_code == 413
+
+
+def test_malformed_content_length_rejected():
+    response = client.post("/", content=b"x", headers={"Content-Length": "abc"})
+    assert response.status_code == 400
+
+
+async def large_body(request: Request) -> PlainTextResponse:
+    return PlainTextResponse("x" * 4096)
+
+
+gzip_app = Starlette(
+    routes=[
+        Route("/list", large_body),
+        Route("/documents/{document_id}/download", large_body),
+    ]
+)
+gzip_app.add_middleware(
+    SelectiveGZipMiddleware,
+    minimum_size=1024,
+    exclude_path=r"/documents/[^/]+/download$",
+)
+gzip_client = TestClient(gzip_app)
+
+
+def test_gzip_applied_to_other_paths():
+    response = gzip_client.get("/list", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_gzip_skipped_for_excluded_paths():
+    response = gzip_client.get(
+        "/documents/1/download", headers={"Accept-Encoding": "gzip"}
+    )
+    assert "content-encoding" not in response.headers
+    assert response.text == "x" * 4096